@@ -1,5 +1,7 @@
 import os
+import asyncio
 import logging
+import threading
 from flask import Flask, request, jsonify
 from telethon import TelegramClient
 
@@ -18,9 +20,22 @@ API_ID = int(os.environ["TELEGRAM_API_ID"])
 API_HASH = os.environ["TELEGRAM_API_HASH"]
 PHONE_NUMBER = os.environ["PHONE_NUMBER"]
 
+# Telethon owns a dedicated event loop running on a background thread.
+# Request handlers submit coroutines to it with run_coroutine_threadsafe
+# instead of spinning the loop per request, so the client stays connected
+# and handlers can run concurrently.
+_loop = asyncio.new_event_loop()
+asyncio.set_event_loop(_loop)  # Telethon binds to the current loop at construction
+
 # Initialize Telethon client
 client = TelegramClient("userbot.session", API_ID, API_HASH)
 
+threading.Thread(target=_loop.run_forever, name="telethon-loop", daemon=True).start()
+
+def run_async(coro, timeout=30):
+    """Run a coroutine on the Telethon loop and wait for its result."""
+    return asyncio.run_coroutine_threadsafe(coro, _loop).result(timeout=timeout)
+
 @app.route("/health")
 def health_check():
     return jsonify({"status": "ok", "service": "user-bot"}), 200
@@ -32,23 +47,26 @@ def forward_message():
         data = request.json
         chat_id = int(data.get("chat_id", 0))
         message_id = int(data.get("message_id", 0))
-        
+
         if not (chat_id and message_id):
             raise ValueError("Missing or invalid chat_id/message_id")
 
-        logger.info(f"Forwarding message: chat_id={chat_id}, message_id={message_id}")
+        logger.info("Forwarding message: chat_id=%s, message_id=%s", chat_id, message_id)
 
         # Forward the message to yourself (or another chat)
-        client.loop.run_until_complete(client.forward_messages("me", message_id, chat_id))
+        run_async(client.forward_messages("me", message_id, chat_id))
 
         return jsonify({"status": "success"}), 200
 
     except Exception as e:
-        logger.error(f"Error forwarding message: {e}")
+        logger.error("Error forwarding message: %s", e)
         return jsonify({"status": "error", "message": str(e)}), 500
 
 if __name__ == "__main__":
-    # Start the Telethon client before running the Flask app
-    with client:
-        logger.info("User bot is running.")
-        app.run(host="0.0.0.0", port=5001)
+    # Start the Telethon client on its loop before serving requests
+    run_async(client.start(phone=PHONE_NUMBER), timeout=120)
+    logger.info("User bot is running.")
+    try:
+        app.run(host="0.0.0.0", port=5001, threaded=True)
+    finally:
+        run_async(client.disconnect())